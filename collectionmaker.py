@@ -1,23 +1,193 @@
 import os
-import xml.etree.ElementTree as ET
-import xml.dom.minidom as minidom
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+from urllib3.util.retry import Retry
 import argparse
+import difflib
+import filecmp
+import functools
 import time
-import gzip
+import io
+import re
+import shutil
 import json
+import pickle
+from xml.sax.saxutils import escape
+import threading
+import unicodedata
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
 
+# Prefer lxml (libxml2) for parsing and serializing, fall back to the standard library
+try:
+    from lxml import etree as ET
+    HAS_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    HAS_LXML = False
+
+# orjson parses the NDJSON collection ID export several times faster when installed
+try:
+    from orjson import loads as json_loads
+    HAS_ORJSON = True
+except ImportError:
+    json_loads = json.loads
+    HAS_ORJSON = False
+
+# python-isal (Intel ISA-L) inflates the gzipped export 2-4x faster than zlib when installed
+try:
+    from isal import igzip as gzip
+except ImportError:
+    import gzip
+
 # Supported video extensions
 VIDEO_EXTENSIONS = ['.mp4', '.mkv', '.avi', '.mov', '.flv', '.wmv', '.webm', '.m4v']
+_VIDEO_EXT_TUPLE = tuple(ext.lower() for ext in VIDEO_EXTENSIONS)  # for str.endswith on lowercased names
+_VIDEO_EXT_RANK = {ext: rank for rank, ext in enumerate(_VIDEO_EXT_TUPLE)}  # earlier extensions win on shared base names
+_NFO_SUFFIX = '.nfo'
+
+# Throttling API calls: at most TMDB_RATE_LIMIT requests per TMDB_RATE_PERIOD seconds.
+# TMDb allows roughly 40 requests per second; 35 leaves headroom for bursts.
+TMDB_RATE_LIMIT = 35
+TMDB_RATE_PERIOD = 1  # seconds
+
+# Images are copied to disk in chunks of this size instead of being buffered whole
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+# Collection images fetched from TMDb, and image host statuses that will not change on a retry
+COLLECTION_IMAGES = ('backdrop.jpg', 'poster.jpg')
+PERMANENT_IMAGE_ERRORS = (403, 404, 410)
+
+# Write buffer for the templated XML writer; large enough that a collection is flushed in one write
+XML_WRITE_BUFFER = 64 * 1024
+
+# Cached TMDb collection responses are reused for this long
+TMDB_CACHE_TTL = 7 * 24 * 3600  # seconds
+
+# Default location of the TMDb response cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'collectionmaker')
+
+# Cheap test for a <set> element so NFOs without a collection skip the XML parse
+_SET_TAG_RE = re.compile(rb'<set[\s/>]')
+
+# Fixed shape of a collection ID export line; lines with escapes or extra keys go through JSON
+_COLLECTION_ID_LINE_RE = re.compile(rb'\{"id":(\d+),"name":"([^"\\]*)"\}\s*$')
+
+# Minimum similarity for --fuzzy_match to accept a TMDb collection name
+FUZZY_MATCH_CUTOFF = 0.9
+
+# Incremental build state, kept at the root of the output directory
+MANIFEST_NAME = '.collectionmaker_manifest.json'
+
+# Concurrent TMDb tasks (collection fetches and image downloads)
+TMDB_WORKERS = 10
+
+# Worker threads used to parse NFO files (I/O bound on network shares); process
+# workers default to one per CPU since parsing on local disks is CPU bound
+DEFAULT_WORKERS = 32
+
+# NFOs handed to each worker process at a time, amortizing the pickling round trips
+PROCESS_CHUNKSIZE = 64
+
+# Worker threads listing library directories in parallel
+SCAN_WORKERS = 32
+
+# Shared HTTP session: keep-alive connection pooling plus retries with backoff
+# (Retry also honours Retry-After on 429 responses)
+_SESSION = requests.Session()
+_HTTP_ADAPTER = HTTPAdapter(pool_connections=20, pool_maxsize=50,
+                            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]))
+_SESSION.mount('https://', _HTTP_ADAPTER)
+_SESSION.mount('http://', _HTTP_ADAPTER)
+
+# lxml parsers must not be shared between threads, so each worker keeps its own
+_thread_local = threading.local()
+
+# Start times of the TMDb requests inside the current rate limit window
+_tmdb_request_times = deque()
+_tmdb_rate_lock = threading.Lock()
+
+def throttle_tmdb_request():
+    """Blocks until another TMDb API request fits within the rate limit."""
+    while True:
+        with _tmdb_rate_lock:
+            now = time.monotonic()
+            while _tmdb_request_times and now - _tmdb_request_times[0] >= TMDB_RATE_PERIOD:
+                _tmdb_request_times.popleft()
+
+            if len(_tmdb_request_times) < TMDB_RATE_LIMIT:
+                _tmdb_request_times.append(now)
+                return
+
+            wait_time = TMDB_RATE_PERIOD - (now - _tmdb_request_times[0])
+        time.sleep(wait_time)
+
+# Directories already created during this run; set operations are atomic, so threads can share it
+_created_dirs = set()
 
-# Throttling API calls
-THROTTLE_TIME = 0.1  # seconds
+def ensure_dir(path):
+    """Creates a directory (and parents) once per run, skipping the syscalls on later calls."""
+    if path not in _created_dirs:
+        os.makedirs(path, exist_ok=True)
+        _created_dirs.add(path)
+
+def get_nfo_parser():
+    """Returns the NFO parser for the current thread (None with the standard library)."""
+    if not HAS_LXML:
+        return None
+
+    parser = getattr(_thread_local, 'parser', None)
+    if parser is None:
+        parser = ET.XMLParser(huge_tree=False, recover=True, collect_ids=False)
+        _thread_local.parser = parser
+    return parser
+
+def load_cached_json(cache_file, max_age=None):
+    """Returns the data stored in a JSON cache file, or None if it is missing, expired or unreadable."""
+    try:
+        if max_age is not None and time.time() - os.path.getmtime(cache_file) > max_age:
+            return None
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_cached_json(cache_file, data):
+    """Writes data to a JSON cache file, replacing it atomically."""
+    temp_file = f"{cache_file}.{threading.get_ident()}.tmp"
+    try:
+        ensure_dir(os.path.dirname(cache_file))
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp_file, cache_file)
+    except OSError as e:
+        logging.warning(f"Could not write cache file {cache_file}: {e}")
+
+def load_cached_pickle(cache_file):
+    """Returns the data stored in a pickle cache file, or None if it is missing or unreadable."""
+    try:
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return None
+
+def save_cached_pickle(cache_file, data):
+    """Writes data to a pickle cache file, replacing it atomically."""
+    temp_file = f"{cache_file}.{threading.get_ident()}.tmp"
+    try:
+        ensure_dir(os.path.dirname(cache_file))
+        with open(temp_file, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, cache_file)
+    except OSError as e:
+        logging.warning(f"Could not write cache file {cache_file}: {e}")
 
 def parse_movie_nfo(nfo_file):
     """Parses the movie NFO to extract relevant collection and file information."""
-    tree = ET.parse(nfo_file)
+    tree = ET.parse(nfo_file, get_nfo_parser())
     root = tree.getroot()
 
     data = {}
@@ -36,8 +206,71 @@ def parse_movie_nfo(nfo_file):
 
     return data
 
-def create_collection_xml(collection_name, collection_data, output_file, library_dir, collection_id=None):
+def replace_if_changed(temp_file, output_file):
+    """Moves a freshly written file into place unless an identical file is already there.
+
+    Returns True if the output file was replaced.
+    """
+    # Leaving identical files alone avoids rewrites and mtime bumps that make Jellyfin rescan
+    if os.path.exists(output_file) and filecmp.cmp(temp_file, output_file, shallow=False):
+        os.remove(temp_file)
+        return False
+
+    os.replace(temp_file, output_file)
+    return True
+
+def escape_text(value):
+    """Escapes a value for use as XML text; missing values become empty text."""
+    return escape(value or '')
+
+def write_collection_xml(f, collection_name, collection_data, library_dir, collection_id=None):
+    """Writes the collection XML from a template of the fixed schema, without building an element tree."""
+    write = f.write
+    write("<?xml version='1.0' encoding='utf-8'?>\n<Item>\n")
+
+    # Basic information about the collection
+    write("  <ContentRating>NR</ContentRating>\n")  # Placeholder for Content Rating
+    write("  <LockData>false</LockData>\n")
+    write(f"  <Overview>{escape_text(collection_data['Overview'])}</Overview>\n")
+    write(f"  <LocalTitle>{escape_text(collection_name)}</LocalTitle>\n")
+    write("  <DisplayOrder>PremiereDate</DisplayOrder>\n")
+
+    if collection_id:
+        write(f"  <TmdbId>{escape_text(str(collection_id))}</TmdbId>\n")
+
+    # Genres and studios
+    for list_tag, item_tag, values in (("Genres", "Genre", collection_data.get('Genres', [])),
+                                       ("Studios", "Studio", collection_data.get('Studios', []))):
+        if not values:
+            write(f"  <{list_tag}/>\n")
+            continue
+        write(f"  <{list_tag}>\n")
+        for value in sorted(values):
+            write(f"    <{item_tag}>{escape_text(value)}</{item_tag}>\n")
+        write(f"  </{list_tag}>\n")
+
+    # Collection Items (file paths)
+    write("  <CollectionItems>\n")
+    for movie in collection_data['Movies']:
+        path = os.path.join(library_dir, movie['FullRelativePath'])
+        write(f"    <CollectionItem>\n      <Path>{escape_text(path)}</Path>\n    </CollectionItem>\n")
+    write("  </CollectionItems>\n</Item>")
+
+def create_collection_xml(collection_name, collection_data, output_file, library_dir, collection_id=None, fast_writer=False):
     """Creates a collection XML file with the gathered data."""
+    output_directory = os.path.dirname(output_file)
+    ensure_dir(output_directory)  # Ensure the output directory exists
+
+    # Write next to the target and rename into place, so readers never see a partial file
+    temp_file = output_file + '.tmp'
+
+    # The templated writer skips tree construction and indenting entirely
+    if fast_writer:
+        with open(temp_file, 'w', encoding='utf-8', buffering=XML_WRITE_BUFFER) as f:
+            write_collection_xml(f, collection_name, collection_data, library_dir, collection_id)
+        log_collection_xml_saved(output_file, replace_if_changed(temp_file, output_file))
+        return
+
     root = ET.Element("Item")
 
     # Basic information about the collection
@@ -53,12 +286,12 @@ def create_collection_xml(collection_name, collection_data, output_file, library
 
     # Genres
     genres_elem = ET.SubElement(root, "Genres")
-    for genre in collection_data.get('Genres', []):
+    for genre in sorted(collection_data.get('Genres', [])):
         ET.SubElement(genres_elem, "Genre").text = genre
 
     # Studios
     studios_elem = ET.SubElement(root, "Studios")
-    for studio in collection_data.get('Studios', []):
+    for studio in sorted(collection_data.get('Studios', [])):
         ET.SubElement(studios_elem, "Studio").text = studio
 
     # Collection Items (file paths)
@@ -70,59 +303,108 @@ def create_collection_xml(collection_name, collection_data, output_file, library
         path = os.path.join(library_dir, movie['FullRelativePath'])
         ET.SubElement(collection_item, "Path").text = path
 
-    # Pretty-print the XML
-    xml_str = ET.tostring(root, encoding='utf-8')
-    dom = minidom.parseString(xml_str)
-    pretty_xml_as_string = dom.toprettyxml(indent="  ")
+    # Stream the formatted XML straight to the file, no intermediate bytes object
+    tree = ET.ElementTree(root)
+    with open(temp_file, 'wb') as f:
+        if HAS_LXML:
+            # lxml indents while serializing, in a single pass
+            tree.write(f, encoding='utf-8', xml_declaration=True, pretty_print=True)
+        else:
+            # Pretty-print the XML in place, no serialize/reparse round trip
+            ET.indent(root, space="  ")
+            tree.write(f, encoding='utf-8', xml_declaration=True)
 
-    # Save the formatted XML string to a file
-    output_directory = os.path.dirname(output_file)
-    os.makedirs(output_directory, exist_ok=True)  # Ensure the output directory exists
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(pretty_xml_as_string)
+    log_collection_xml_saved(output_file, replace_if_changed(temp_file, output_file))
 
-    logging.info(f"Collection XML saved to {output_file}")
+def log_collection_xml_saved(output_file, replaced):
+    """Logs the outcome of writing a collection XML."""
+    if replaced:
+        logging.info(f"Collection XML saved to {output_file}")
+    else:
+        logging.info(f"Collection XML unchanged, kept existing file: {output_file}")
 
 def download_image(url, output_dir, name, overwrite=False):
-    """Downloads an image from a URL and saves it to the specified directory."""
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    """Downloads an image from a URL and saves it to the specified directory.
+
+    Returns False if the image host reported the image as unavailable, so later runs need not retry it.
+    """
+    ensure_dir(output_dir)
 
     image_path = os.path.join(output_dir, name)
 
-    # Check if the image exists and whether it should be overwritten
+    # Check if the image exists and whether it should be overwritten.
+    # Images are renamed into place once complete, so an existing file is never truncated.
     if not os.path.exists(image_path) or overwrite:
+        partial_path = image_path + '.part'
         try:
-            response = requests.get(url)
-            response.raise_for_status()
+            with _SESSION.get(url, stream=True) as response:
+                response.raise_for_status()
 
-            # Save the image with the appropriate name
-            with open(image_path, 'wb') as img_file:
-                img_file.write(response.content)
-                logging.info(f"Downloaded image: {image_path}")
+                # Stream the image to disk so memory stays flat regardless of its size
+                response.raw.decode_content = True
+                with open(partial_path, 'wb') as img_file:
+                    shutil.copyfileobj(response.raw, img_file, IMAGE_CHUNK_SIZE)
+            os.replace(partial_path, image_path)
+            logging.info(f"Downloaded image: {image_path}")
 
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, Urllib3HTTPError, OSError) as e:
             logging.error(f"Error downloading image from {url}: {e}")
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+            response = getattr(e, 'response', None)
+            if response is not None and response.status_code in PERMANENT_IMAGE_ERRORS:
+                return False
     else:
         logging.info(f"Image already exists, skipping download: {image_path}")
-
-def fetch_collection_data_from_tmdb(tmdb_id, api_key):
-    """Fetches collection metadata from TMDb for a given collection."""
+    return True
+
+def select_tmdb_image(images, default_path):
+    """Picks the best-rated English image, then the best language-neutral one, then TMDb's default."""
+    for language in ('en', None):
+        candidates = [image for image in images if image.get('iso_639_1') == language and image.get('file_path')]
+        if candidates:
+            return max(candidates, key=lambda image: image.get('vote_average', 0))['file_path']
+    return default_path
+
+@functools.lru_cache(maxsize=2048)
+def fetch_collection_data_from_tmdb(tmdb_id, api_key, cache_dir=None):
+    """Fetches collection metadata from TMDb for a given collection, using the disk cache when fresh.
+
+    Results are memoized for the run, so collections sharing a TMDb ID cost one lookup.
+    """
     if not api_key:
         logging.info("No TMDb API key provided. Skipping TMDb fetch.")
         return {'Overview': 'No overview available.', 'Genres': [], 'Studios': [], 'Images': []}
 
+    cache_file = os.path.join(cache_dir, f"collection_{tmdb_id}.json") if cache_dir else None
+
     try:
-        time.sleep(THROTTLE_TIME)  # Throttle API calls
-        collection_info = requests.get(f"https://api.themoviedb.org/3/collection/{tmdb_id}?api_key={api_key}").json()
-        
+        collection_info = load_cached_json(cache_file, TMDB_CACHE_TTL) if cache_file else None
+        if collection_info is None:
+            throttle_tmdb_request()  # Throttle API calls
+            # One request returns the details and the image lists (English and language-neutral only)
+            response = _SESSION.get(f"https://api.themoviedb.org/3/collection/{tmdb_id}?api_key={api_key}"
+                                    f"&append_to_response=images&include_image_language=en,null")
+            # A collection TMDb does not know has no images to offer; other errors are retried next run
+            if response.status_code != 404:
+                response.raise_for_status()
+            collection_info = response.json()
+
+            # Only successful responses are worth reusing
+            if cache_file and response.ok:
+                save_cached_json(cache_file, collection_info)
+
         if collection_info:
-            # Prepare to download images
+            # Prepare to download images, preferring English ones
             images = []
-            if 'backdrop_path' in collection_info:
-                images.append((f"https://image.tmdb.org/t/p/original{collection_info['backdrop_path']}", "backdrop.jpg"))
-            if 'poster_path' in collection_info:
-                images.append((f"https://image.tmdb.org/t/p/original{collection_info['poster_path']}", "poster.jpg"))
+            image_lists = collection_info.get('images') or {}
+            backdrop_path = select_tmdb_image(image_lists.get('backdrops', []), collection_info.get('backdrop_path'))
+            if backdrop_path:
+                images.append((f"https://image.tmdb.org/t/p/original{backdrop_path}", "backdrop.jpg"))
+            poster_path = select_tmdb_image(image_lists.get('posters', []), collection_info.get('poster_path'))
+            if poster_path:
+                images.append((f"https://image.tmdb.org/t/p/original{poster_path}", "poster.jpg"))
 
             return {
                 'Overview': collection_info.get('overview', 'No overview available.'),
@@ -135,115 +417,364 @@ def fetch_collection_data_from_tmdb(tmdb_id, api_key):
             return {'Overview': 'No overview available.', 'Genres': [], 'Studios': [], 'Images': []}
     except requests.exceptions.RequestException as e:
         logging.error(f"Error fetching collection data from TMDb for ID {tmdb_id}: {e}")
-        return {'Overview': 'No overview available.', 'Genres': [], 'Studios': [], 'Images': []}
-
-def find_video_file_for_nfo(nfo_file):
-    """Finds the video file that corresponds to the given NFO file."""
-    # Get the directory containing the NFO file
-    nfo_dir = os.path.dirname(nfo_file)
-    nfo_base = os.path.splitext(os.path.basename(nfo_file))[0]
-
-    # Search for matching video files
-    for ext in VIDEO_EXTENSIONS:
-        video_file_path = os.path.join(nfo_dir, nfo_base + ext)
-        if os.path.exists(video_file_path):
-            return video_file_path
-    return None
-
-def download_and_extract_collection_ids():
-    """Downloads and extracts the collection IDs from TMDb."""
+        # Images is None rather than empty so the caller knows TMDb's image list is unknown
+        return {'Overview': 'No overview available.', 'Genres': [], 'Studios': [], 'Images': None}
+
+def scan_directory(path):
+    """Lists one library directory, returning its (NFO, video, NFO mtime) entries and its subdirectories."""
+    nfo_dir_entries = []
+    videos_by_base = {}
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                # The entry type comes from the directory listing itself, so no stat is needed.
+                # Like os.walk, symlinked directories are not descended into.
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                    continue
+
+                # Partition NFOs and videos in the same pass; names are lowercased once so
+                # upper-case extensions (MOVIE.NFO, movie.MKV) match too
+                name = entry.name
+                name_lower = name.lower()
+                if name_lower.endswith(_NFO_SUFFIX):
+                    nfo_dir_entries.append((entry, name[:-len(_NFO_SUFFIX)]))
+                elif name_lower.endswith(_VIDEO_EXT_TUPLE):
+                    # Several videos can share a base name (movie.mkv, movie.mp4); keep the one whose
+                    # extension comes first in VIDEO_EXTENSIONS, whatever the listing order
+                    dot = name.rfind('.')
+                    base = name[:dot]
+                    candidate = (_VIDEO_EXT_RANK[name_lower[dot:]], name)
+                    if base not in videos_by_base or candidate < videos_by_base[base]:
+                        videos_by_base[base] = candidate
+    except OSError as e:
+        logging.warning(f"Could not list directory {path}: {e}")
+        return [], []
+
+    nfo_entries = []
+    for entry, base in nfo_dir_entries:
+        try:
+            mtime = entry.stat().st_mtime
+        except OSError as e:
+            logging.warning(f"Could not stat NFO {entry.path}: {e}")
+            continue
+
+        video = videos_by_base.get(base)
+        video_file = os.path.join(path, video[1]) if video else None
+        nfo_entries.append((entry.path, video_file, mtime))
+
+    return nfo_entries, subdirs
+
+def find_nfo_files(library_dir, workers=SCAN_WORKERS):
+    """Walks the library listing many directories at once, returning sorted (NFO, video, NFO mtime) entries."""
+    nfo_entries = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(scan_directory, library_dir)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_nfo_entries, subdirs = future.result()
+                nfo_entries.extend(dir_nfo_entries)
+                for subdir in subdirs:
+                    pending.add(executor.submit(scan_directory, subdir))
+
+    # Listings complete in any order; sort so output is stable between runs
+    nfo_entries.sort()
+    return nfo_entries
+
+def parse_collection_id_line(line):
+    """Returns (name, id) for one line of the TMDb collection ID export."""
+    # Without orjson, matching the fixed line shape is faster than the stdlib JSON parser
+    # (orjson itself beats the regex, so it is used directly when installed)
+    if not HAS_ORJSON:
+        match = _COLLECTION_ID_LINE_RE.match(line)
+        if match:
+            return match.group(2).decode('utf-8'), int(match.group(1))
+
+    entry = json_loads(line)
+    return entry['name'], entry['id']
+
+def remove_stale_collection_id_caches(cache_dir, current_cache_file):
+    """Deletes cached collection ID exports from previous days."""
+    try:
+        with os.scandir(cache_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('collection_ids_') and entry.path != current_cache_file:
+                    os.remove(entry.path)
+    except OSError as e:
+        logging.warning(f"Could not clean up cached collection IDs in {cache_dir}: {e}")
+
+def normalize_collection_name(name):
+    """Normalizes a collection name for ID lookups, ignoring case, accents, '/' separators and spacing."""
+    name = unicodedata.normalize('NFKD', name.replace('/', ' - '))
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    return ' '.join(name.casefold().split())
+
+def lookup_collection_id(collection_ids, normalized_collection_ids, collection_name, fuzzy=False):
+    """Returns the TMDb ID for a collection name, or None if not found.
+
+    An exact name match wins over a normalized one, so case or accent variants cannot shadow it.
+    """
+    collection_id = collection_ids.get(collection_name)
+    if collection_id is not None:
+        return collection_id
+
+    normalized_name = normalize_collection_name(collection_name)
+    collection_id = normalized_collection_ids.get(normalized_name)
+
+    # Optionally fall back to the closest TMDb name, for typos in NFO set names
+    if collection_id is None and fuzzy and normalized_collection_ids:
+        matches = difflib.get_close_matches(normalized_name, normalized_collection_ids.keys(), n=1, cutoff=FUZZY_MATCH_CUTOFF)
+        if matches:
+            logging.info(f"Matched collection '{collection_name}' to TMDb collection '{matches[0]}'")
+            collection_id = normalized_collection_ids[matches[0]]
+
+    return collection_id
+
+def download_and_extract_collection_ids(cache_dir=None):
+    """Downloads and extracts the collection IDs from TMDb, keyed by exact and by normalized name.
+
+    Reuses today's cached copy if present.
+    """
     current_date = datetime.now().strftime("%m_%d_%Y")
     url = f"http://files.tmdb.org/p/exports/collection_ids_{current_date}.json.gz"
-    
+
+    # The export is published daily, so the cached copy is keyed by date. It is pickled
+    # because loading the large dicts that way is about twice as fast as parsing JSON.
+    # The suffix changes whenever the pickled structure does, so older caches are not reused.
+    cache_file = os.path.join(cache_dir, f"collection_ids_{current_date}_v2.pkl") if cache_dir else None
+    if cache_file:
+        cached = load_cached_pickle(cache_file)
+        if cached is not None:
+            logging.info(f"Using cached collection IDs from {cache_file}")
+            return cached
+
     try:
         logging.info(f"Downloading collection IDs from {url}")
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        # Decompress the gzipped content
-        json_data = gzip.decompress(response.content)
-        
-        # Decode the decompressed bytes into a string
-        json_lines = json_data.decode('utf-8').splitlines()
-        
-        # Parse each line as a separate JSON object and build a dictionary
         collection_ids = {}
-        for line in json_lines:
-            try:
-                entry = json.loads(line)
-                collection_ids[entry['name']] = entry['id']
-            except json.JSONDecodeError as e:
-                logging.warning(f"Skipping invalid JSON line: {line} ({e})")
-        
-        return collection_ids
+        normalized_collection_ids = {}
+        with _SESSION.get(url, stream=True) as response:
+            response.raise_for_status()
+
+            # Decompress the export as it arrives instead of buffering the whole payload.
+            # The body is the .gz file itself, so read the raw bytes without transfer decoding.
+            response.raw.decode_content = False
+            with gzip.GzipFile(fileobj=response.raw) as json_lines:
+                # Parse each line as a separate JSON object and build a dictionary
+                for line in json_lines:
+                    if not line.strip():
+                        continue
+                    try:
+                        name, collection_id = parse_collection_id_line(line)
+                        collection_ids[name] = collection_id
+                        # The first TMDb name to claim a normalized key keeps it
+                        normalized_collection_ids.setdefault(normalize_collection_name(name), collection_id)
+                    except ValueError as e:  # Covers JSON (and orjson) decode errors and bad UTF-8
+                        logging.warning(f"Skipping invalid JSON line: {line.decode('utf-8', 'replace').strip()} ({e})")
+
+        if cache_file and collection_ids:
+            save_cached_pickle(cache_file, (collection_ids, normalized_collection_ids))
+            remove_stale_collection_id_caches(cache_dir, cache_file)
+
+        return collection_ids, normalized_collection_ids
         
-    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+    except (requests.exceptions.RequestException, Urllib3HTTPError, OSError, EOFError) as e:
         logging.error(f"Failed to download or parse collection IDs: {e}")
-        return {}
+        return {}, {}
 
-def process_movie_nfo_files(library_dir, output_dir, api_key, overwrite=False):
-    """Scans movie NFOs and builds collection XMLs based on the movie's collection information."""
-    collections = {}
+def load_movie_nfo(nfo_file):
+    """Returns the movie data for an NFO, or None for NFOs without a <set> element, which are not parsed at all."""
+    with open(nfo_file, 'rb') as f:
+        content = f.read()
 
-    # If the API key is provided, download the collection IDs
-    collection_ids = {}
-    if api_key:
-        collection_ids = download_and_extract_collection_ids()
+    # UTF-16 files cannot be searched bytewise, so they always get the full parse
+    if not content.startswith((b'\xff\xfe', b'\xfe\xff')) and not _SET_TAG_RE.search(content):
+        return None
 
-    # Traverse the NFO directory to find all NFO files
-    for root, dirs, files in os.walk(library_dir):
-        for file in files:
-            if file.endswith('.nfo'):
-                nfo_file_path = os.path.join(root, file)
+    return parse_movie_nfo(io.BytesIO(content))
 
-                # Parse the movie NFO
-                movie_data = parse_movie_nfo(nfo_file_path)
+def get_collection_name(movie_data):
+    """Returns the collection folder name for a movie, or None if it is not part of a collection."""
+    if not movie_data or not movie_data['CollectionName']:
+        return None
 
-                # Check if the movie has a collection name
-                if movie_data['CollectionName']:
-                    # Clean up the collection name for folder naming
-                    collection_name = f"{movie_data['CollectionName'].replace('/', ' - ')}"
+    # Clean up the collection name for folder naming
+    return movie_data['CollectionName'].replace('/', ' - ')
 
-                    # Find the video file that matches the NFO
-                    video_file = find_video_file_for_nfo(nfo_file_path)
+def collection_images_exist(collection_dir, names=COLLECTION_IMAGES):
+    """Checks whether the given TMDb images (by default both) for a collection are already on disk."""
+    return all(os.path.exists(os.path.join(collection_dir, name)) for name in names)
 
-                    if not video_file:
-                        logging.warning(f"No matching video file found for NFO: {nfo_file_path}")
-                        continue
+def process_collection(collection_name, collection_data, collection_id, output_dir, library_dir, api_key, overwrite=False, cache_dir=None,
+                       fast_writer=False):
+    """Writes the XML for a single collection and returns the download_image arguments for its TMDb images.
+
+    Also returns the names of the images TMDb offers, or None if they could not be fetched.
+    """
+    output_file_path = os.path.join(output_dir, collection_name, 'collection.xml')
 
-                    # Use the full path relative to the library directory
-                    movie_relative_path = os.path.relpath(video_file, library_dir)
-
-                    # Add the movie to its collection
-                    if collection_name not in collections:
-                        collections[collection_name] = {
-                            'Overview': movie_data['Overview'],
-                            'Movies': [],
-                            'Genres': [],
-                            'Studios': []
-                        }
-                    collections[collection_name]['Movies'].append({
-                        'Title': movie_data['LocalTitle'],
-                        'FullRelativePath': movie_relative_path,
-                    })
-
-                    # Add genres and studios, ensuring no duplicates
-                    collections[collection_name]['Genres'] = list(set(collections[collection_name]['Genres'] + movie_data['Genres']))
-                    collections[collection_name]['Studios'] = list(set(collections[collection_name]['Studios'] + movie_data['Studios']))
-
-    # Generate XML files for each collection
-    for collection_name, collection_data in collections.items():
-        collection_id = collection_ids.get(collection_name)  # Get the collection ID if available
-        output_file_path = os.path.join(output_dir, collection_name, 'collection.xml')
-
-        # Create the collection XML
-        create_collection_xml(collection_name, collection_data, output_file_path, library_dir, collection_id)
-
-        # Download collection images if any exist
-        if collection_id:
-            tmdb_data = fetch_collection_data_from_tmdb(collection_id, api_key)
-            for img_url, img_name in tmdb_data['Images']:
-                download_image(img_url, os.path.join(output_dir, collection_name), img_name, overwrite)
+    # Create the collection XML
+    create_collection_xml(collection_name, collection_data, output_file_path, library_dir, collection_id, fast_writer)
+
+    # Collect the collection images if any exist; the caller downloads them concurrently
+    image_jobs = []
+    if collection_id:
+        # Only the images are taken from TMDb, so once both are on disk there is nothing to fetch
+        collection_dir = os.path.join(output_dir, collection_name)
+        if not overwrite and collection_images_exist(collection_dir):
+            logging.info(f"Collection images already exist, skipping TMDb fetch: {collection_name}")
+            return image_jobs, list(COLLECTION_IMAGES)
+
+        tmdb_data = fetch_collection_data_from_tmdb(collection_id, api_key, cache_dir)
+        if tmdb_data['Images'] is None:
+            return image_jobs, None
+        for img_url, img_name in tmdb_data['Images']:
+            image_jobs.append((img_url, os.path.join(output_dir, collection_name), img_name, overwrite))
+    return image_jobs, [image_job[2] for image_job in image_jobs]
+
+def process_movie_nfo_files(library_dir, output_dir, api_key, overwrite=False, workers=None, cache_dir=None, workers_type='thread',
+                            fast_writer=False, min_movies=1, fuzzy_match=False):
+    """Scans movie NFOs and builds collection XMLs based on the movie's collection information."""
+    collections = {}
+
+    # If the API key is provided, download the collection IDs
+    collection_ids, normalized_collection_ids = {}, {}
+    if api_key:
+        collection_ids, normalized_collection_ids = download_and_extract_collection_ids(cache_dir)
+
+    # Traverse the NFO directory to find all NFO files, matching videos from the same listing
+    nfo_entries = find_nfo_files(library_dir)
+    library_prefix = os.path.join(library_dir, '')
+
+    # The manifest from the previous run lets unchanged NFOs and collections be skipped
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_cached_json(manifest_path) or {}
+    previous_nfos = manifest.get('nfos', {})
+    previous_collection_ids = manifest.get('collection_ids', {})
+    previous_images = manifest.get('images', {})
+    current_nfos = {}
+    changed_collections = set()
+
+    # Threads overlap slow network reads; processes sidestep the GIL when parsing is CPU bound
+    if workers_type == 'process':
+        executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        chunksize = PROCESS_CHUNKSIZE
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers or DEFAULT_WORKERS)
+        chunksize = 1
+
+    # Unchanged NFOs are reused from the manifest, so only changed ones are sent to the workers
+    changed_nfo_files = [nfo_file_path for nfo_file_path, _, mtime in nfo_entries
+                         if previous_nfos.get(nfo_file_path, {}).get('mtime') != mtime]
+    with executor:
+        parsed_nfos = dict(zip(changed_nfo_files, executor.map(load_movie_nfo, changed_nfo_files, chunksize=chunksize)))
+
+    # Merge the results on this thread in scan order
+    for nfo_file_path, video_file, mtime in nfo_entries:
+        previous_entry = previous_nfos.pop(nfo_file_path, None)
+        changed = nfo_file_path in parsed_nfos
+        movie_data = parsed_nfos[nfo_file_path] if changed else previous_entry['movie']
+        current_nfos[nfo_file_path] = {'mtime': mtime, 'video': video_file, 'movie': movie_data}
+        collection_name = get_collection_name(movie_data)
+
+        # A changed movie invalidates both the collection it was in and the one it is in now
+        if changed or previous_entry.get('video') != video_file:
+            changed_collections.add(collection_name)
+            if previous_entry:
+                changed_collections.add(get_collection_name(previous_entry['movie']))
+
+        # Check if the movie has a collection name
+        if not collection_name:
+            continue
+
+        if not video_file:
+            logging.warning(f"No matching video file found for NFO: {nfo_file_path}")
+            continue
+
+        # Use the full path relative to the library directory. Scanned paths are built by joining
+        # onto library_dir, so stripping the prefix is enough; relpath is only a fallback.
+        if video_file.startswith(library_prefix):
+            movie_relative_path = video_file[len(library_prefix):]
+        else:
+            movie_relative_path = os.path.relpath(video_file, library_dir)
+
+        # Add the movie to its collection
+        if collection_name not in collections:
+            collections[collection_name] = {
+                'Overview': movie_data['Overview'],
+                'Movies': [],
+                'Genres': set(),
+                'Studios': set()
+            }
+        collections[collection_name]['Movies'].append({
+            'Title': movie_data['LocalTitle'],
+            'FullRelativePath': movie_relative_path,
+        })
+
+        # Add genres and studios, ensuring no duplicates (empty tags are ignored)
+        collections[collection_name]['Genres'].update(genre for genre in movie_data['Genres'] if genre)
+        collections[collection_name]['Studios'].update(studio for studio in movie_data['Studios'] if studio)
+
+    # Movies whose NFO disappeared leave their old collection out of date
+    for previous_entry in previous_nfos.values():
+        changed_collections.add(get_collection_name(previous_entry['movie']))
+
+    # Generate XML files for each collection, overlapping the TMDb requests and image downloads
+    resolved_collection_ids = {}
+    collection_images = {}
+    with ThreadPoolExecutor(max_workers=TMDB_WORKERS) as executor:
+        futures = {}
+        for collection_name, collection_data in collections.items():
+            # Small collections are dropped before any XML or TMDb work is spent on them
+            if len(collection_data['Movies']) < min_movies:
+                logging.info(f"Collection has fewer than {min_movies} movies, skipping: {collection_name}")
+                continue
+
+            # Get the collection ID if available
+            collection_id = lookup_collection_id(collection_ids, normalized_collection_ids, collection_name, fuzzy_match)
+            resolved_collection_ids[collection_name] = collection_id
+
+            # Skip collections whose movies and TMDb ID are unchanged since the XML was written, unless
+            # images TMDb offered are still missing (a failed download, or one deleted to refresh it).
+            # Collections missing from the manifest were not written last run (e.g. dropped by --min_movies),
+            # and without a recorded image list both images are expected.
+            collection_dir = os.path.join(output_dir, collection_name)
+            expected_images = previous_images.get(collection_name, COLLECTION_IMAGES)
+            if (not overwrite and collection_name not in changed_collections
+                    and collection_name in previous_collection_ids
+                    and previous_collection_ids[collection_name] == collection_id
+                    and os.path.exists(os.path.join(collection_dir, 'collection.xml'))
+                    and (not collection_id or collection_images_exist(collection_dir, expected_images))):
+                logging.info(f"Collection unchanged, skipping: {collection_name}")
+                if collection_name in previous_images:
+                    collection_images[collection_name] = previous_images[collection_name]
+                continue
+
+            future = executor.submit(process_collection, collection_name, collection_data, collection_id,
+                                     output_dir, library_dir, api_key, overwrite, cache_dir, fast_writer)
+            futures[future] = collection_name
+
+        # Fan each collection's images out to the pool as soon as its TMDb data arrives
+        image_futures = {}
+        for future in as_completed(futures):
+            image_jobs, image_names = future.result()
+            if image_names is not None:
+                collection_images[futures[future]] = image_names
+            for image_job in image_jobs:
+                image_futures[executor.submit(download_image, *image_job)] = (futures[future], image_job[2])
+
+        # Images the host reports as unavailable are not expected on later runs
+        for future, (collection_name, image_name) in image_futures.items():
+            if not future.result():
+                collection_images[collection_name].remove(image_name)
+
+    # Record what this run saw so the next run can skip unchanged work
+    save_cached_json(manifest_path, {
+        'nfos': current_nfos,
+        'collection_ids': resolved_collection_ids,
+        'images': collection_images,
+    })
 
 def main():
     parser = argparse.ArgumentParser(description="Create collection XML files from NFOs.")
@@ -251,6 +782,13 @@ def main():
     parser.add_argument('--output_dir', default='/var/lib/jellyfin/data/collections', help='Output directory for collection XMLs.')
     parser.add_argument("--key", help="TMDb API key for fetching additional collection data.")
     parser.add_argument("--overwrite", action='store_true', help="Overwrite existing XML files.")
+    parser.add_argument("--cache_dir", default=DEFAULT_CACHE_DIR, help="Directory for cached TMDb responses (empty to disable).")
+    parser.add_argument("--workers", type=int, help="Number of workers used to parse NFO files (default: 32 threads, or one process per CPU).")
+    parser.add_argument("--workers_type", choices=['thread', 'process'], default='thread',
+                        help="Parse NFOs with threads (network storage) or processes (fast local storage).")
+    parser.add_argument("--min_movies", type=int, default=1, help="Only create collections with at least this many movies.")
+    parser.add_argument("--fuzzy_match", action='store_true', help="Match NFO set names to the closest TMDb collection name when there is no exact match.")
+    parser.add_argument("--fast_writer", action='store_true', help="Write collection XMLs from a template instead of an element tree.")
 
     args = parser.parse_args()
 
@@ -258,7 +796,9 @@ def main():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
     # Process the movie NFO files
-    process_movie_nfo_files(args.library_dir, args.output_dir, args.key, args.overwrite)
+    process_movie_nfo_files(args.library_dir, args.output_dir, args.key, overwrite=args.overwrite, workers=args.workers,
+                            cache_dir=args.cache_dir, workers_type=args.workers_type, fast_writer=args.fast_writer,
+                            min_movies=args.min_movies, fuzzy_match=args.fuzzy_match)
 
 if __name__ == "__main__":
     main()